@@ -0,0 +1,164 @@
+"""Bounded, priority-aware admission control for CPU/memory heavy endpoints.
+
+At most ``max_concurrency`` jobs run at once and at most ``max_queue`` wait.
+Waiters are served lowest priority number first (cheap barcode decodes ahead
+of classification). A request is shed up front, with a retry hint, when the
+queue is full or when the expected wait plus its typical service time would
+overrun its deadline. Callers turn the shed into a 503 with Retry-After.
+"""
+import asyncio
+import heapq
+import itertools
+import math
+import os
+from collections import Counter
+from contextlib import asynccontextmanager
+
+PRIORITY_BARCODE = 0
+PRIORITY_CLASSIFY = 1
+
+# Starting guesses for service time (seconds) per priority, until real jobs are measured
+DEFAULT_SERVICE_SECONDS = {
+    PRIORITY_BARCODE: 0.2,
+    PRIORITY_CLASSIFY: 1.0
+}
+
+# Weight of the newest sample in the per-priority service time moving average
+EWMA_ALPHA = 0.2
+
+
+class Overloaded(Exception):
+    """Raised when a request is shed instead of admitted."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    def __init__(self, max_concurrency: int = 2, max_queue: int = 16):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self._active = 0
+        self._running = Counter()
+        self._waiters = []  # heap of [priority, seq, future]
+        self._queued = 0
+        self._seq = itertools.count()
+        self._service_seconds = {}
+
+    def _expected_service(self, priority: int):
+        return self._service_seconds.get(priority, DEFAULT_SERVICE_SECONDS.get(priority, 1.0))
+
+    def _expected_wait(self, priority: int):
+        """Rough time until a new job of this priority would start."""
+        if self._active < self.max_concurrency and self._queued == 0:
+            return 0.0
+        ahead = [
+            self._expected_service(p)
+            for p, _, fut in self._waiters
+            if p <= priority and not fut.done()
+        ]
+        # Jobs ahead drain in parallel; on average the running ones are half done
+        running = 0.0
+        if self._active >= self.max_concurrency and self._running:
+            running = min(self._expected_service(p) for p in self._running) / 2
+        return sum(ahead) / self.max_concurrency + running
+
+    def _retry_after(self, priority: int):
+        return max(1, math.ceil(self._expected_wait(priority) + self._expected_service(priority)))
+
+    def _evict_lowest_priority(self, priority: int):
+        """Shed the least urgent waiter to make room for a more urgent one; True if one was shed."""
+        live = [entry for entry in self._waiters if not entry[2].done()]
+        if not live:
+            return False
+        worst = max(live, key=lambda entry: (entry[0], entry[1]))
+        if worst[0] <= priority:
+            return False
+        worst[2].set_exception(Overloaded("Displaced by a higher priority request", self._retry_after(worst[0])))
+        self._queued -= 1
+        return True
+
+    def _grant_next(self):
+        """Hand free slots to the most urgent live waiters."""
+        while self._active < self.max_concurrency and self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if fut.done():
+                continue
+            self._queued -= 1
+            self._active += 1
+            fut.set_result(None)
+
+    def _release(self):
+        self._active -= 1
+        self._grant_next()
+
+    @asynccontextmanager
+    async def slot(self, priority: int, budget_seconds: float):
+        """Hold one concurrency slot for the body, or raise Overloaded if it cannot finish in budget."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + budget_seconds
+        service = self._expected_service(priority)
+
+        if self._active < self.max_concurrency and self._queued == 0:
+            self._active += 1
+        else:
+            if self._queued >= self.max_queue and not self._evict_lowest_priority(priority):
+                raise Overloaded("Server busy: admission queue is full", self._retry_after(priority))
+            if loop.time() + self._expected_wait(priority) + service > deadline:
+                raise Overloaded("Server busy: request cannot finish within its deadline", self._retry_after(priority))
+
+            fut = loop.create_future()
+            heapq.heappush(self._waiters, [priority, next(self._seq), fut])
+            self._queued += 1
+            try:
+                # The job must start early enough to finish by its deadline
+                await asyncio.wait_for(asyncio.shield(fut), max(0.0, deadline - loop.time() - service))
+            except asyncio.TimeoutError:
+                if fut.done() and not fut.cancelled() and fut.exception() is None:
+                    # Granted at the last moment; give the slot back
+                    self._release()
+                elif not fut.done():
+                    fut.cancel()
+                    self._queued -= 1
+                raise Overloaded("Server busy: request timed out waiting in queue", self._retry_after(priority))
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled() and fut.exception() is None:
+                    self._release()
+                elif not fut.done():
+                    fut.cancel()
+                    self._queued -= 1
+                raise
+
+        self._running[priority] += 1
+        start = loop.time()
+        try:
+            yield
+        finally:
+            self._running[priority] -= 1
+            if self._running[priority] <= 0:
+                del self._running[priority]
+            elapsed = loop.time() - start
+            previous = self._service_seconds.get(priority)
+            self._service_seconds[priority] = (
+                elapsed if previous is None else EWMA_ALPHA * elapsed + (1 - EWMA_ALPHA) * previous
+            )
+            self._release()
+
+    def stats(self):
+        return {
+            "active": self._active,
+            "queued": self._queued,
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "service_seconds": dict(self._service_seconds)
+        }
+
+
+def admission_from_env():
+    """Build a controller from ADMISSION_MAX_CONCURRENCY / ADMISSION_MAX_QUEUE."""
+    return AdmissionController(
+        max_concurrency=int(os.getenv("ADMISSION_MAX_CONCURRENCY", "2")),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+    )
@@ -0,0 +1,238 @@
+"""Local "similar but healthier" recommender over nutrient vectors.
+
+Every dish from the nutrition catalog and every Open Food Facts product the
+backend has seen is embedded as a vector of (calories, protein, fat, carbs,
+sugar, fiber, sodium). Columns are scaled by fixed per-feature factors and
+rows are L2-normalized, so a single matrix-vector product gives the cosine
+similarity of a query to every item. Candidates must clear a similarity
+cutoff, beat the query's linear health score (per 100 kcal, so a smaller
+portion of the same food is not "healthier") and match any category/country
+filter, so queries never leave the process.
+"""
+import threading
+
+import numpy as np
+
+FEATURES = ("calories", "protein", "fat", "carbs", "sugar", "fiber", "sodium")
+
+# Nutrition catalog column for each feature (missing columns are treated as 0)
+CATALOG_COLUMNS = {
+    "calories": "Calories (kcal)",
+    "protein": "Protein (g)",
+    "fat": "Fat (g)",
+    "carbs": "Carbohydrates (g)",
+    "sugar": "Sugar (g)",
+    "fiber": "Fiber (g)",
+    "sodium": "Sodium (g)"
+}
+
+# Per-unit contribution of each feature to the health score: higher is healthier
+HEALTH_WEIGHTS = np.array([-0.01, 0.5, -0.3, -0.05, -0.5, 0.6, -2.0])
+
+# Energy basis the health score is computed on
+SCORE_BASIS_KCAL = 100.0
+
+# Smallest health score gain that counts as healthier; also keeps equal scores
+# that differ only by floating-point noise from being offered
+DEFAULT_MIN_GAIN = 0.05
+
+# Typical spread of each feature, used to scale columns when the catalog gives none
+DEFAULT_SCALE = np.array([100.0, 5.0, 5.0, 15.0, 5.0, 2.0, 0.2])
+
+# Results below this cosine similarity are not offered as alternatives
+DEFAULT_MIN_SIMILARITY = 0.9
+
+# Initial row capacity; storage doubles when full so appends are amortized O(1)
+INITIAL_CAPACITY = 256
+
+SOURCE_DISH = "dish"
+SOURCE_OFF = "off"
+
+
+def nutrient_vector(nutrients: dict):
+    """Build a feature vector from a dict keyed by FEATURES (missing or bad values become 0)."""
+    values = []
+    for feature in FEATURES:
+        try:
+            values.append(float(nutrients.get(feature) or 0))
+        except (TypeError, ValueError):
+            values.append(0.0)
+    return np.array(values)
+
+
+def health_scores(raw: np.ndarray):
+    """Health score per SCORE_BASIS_KCAL for each row of a raw (unscaled) feature matrix.
+
+    Rows are rescaled to the same energy before scoring, matching the
+    portion-independent similarity; rows without calories are scored as given.
+    """
+    raw = np.atleast_2d(raw)
+    calories = raw[:, 0]
+    factor = np.where(calories > 0, SCORE_BASIS_KCAL / np.where(calories > 0, calories, 1.0), 1.0)
+    return (raw * factor[:, np.newaxis]) @ HEALTH_WEIGHTS
+
+
+class AlternativesIndex:
+    """In-memory nearest-neighbour index of dishes and products by nutrient profile."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys = []
+        self._items = []
+        self._positions = {}
+        self._pending = {}
+        self._size = 0
+        self._scale = DEFAULT_SCALE.copy()
+        self._sources = np.empty(INITIAL_CAPACITY, dtype=object)
+        self._raw = np.zeros((INITIAL_CAPACITY, len(FEATURES)))
+        self._embedded = np.zeros((INITIAL_CAPACITY, len(FEATURES)))
+        self._health = np.zeros(INITIAL_CAPACITY)
+
+    def __len__(self):
+        with self._lock:
+            return self._size + sum(1 for key in self._pending if key not in self._positions)
+
+    def _reserve(self, rows: int):
+        """Grow the backing arrays (by doubling) so that rows more items fit."""
+        needed = self._size + rows
+        capacity = len(self._raw)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ("_raw", "_embedded"):
+            grown = np.zeros((capacity, len(FEATURES)))
+            grown[:self._size] = getattr(self, name)[:self._size]
+            setattr(self, name, grown)
+        health = np.zeros(capacity)
+        health[:self._size] = self._health[:self._size]
+        self._health = health
+        sources = np.empty(capacity, dtype=object)
+        sources[:self._size] = self._sources[:self._size]
+        self._sources = sources
+
+    def _write_rows(self, start: int, raw: np.ndarray, sources):
+        """Store, embed and score rows [start, start + len(raw)) (caller holds the lock)."""
+        end = start + len(raw)
+        self._raw[start:end] = raw
+        self._embedded[start:end] = self._embed(raw)
+        self._health[start:end] = health_scores(raw)
+        self._sources[start:end] = sources
+
+    def add_catalog(self, catalog):
+        """Bulk-load every dish of a NutritionCatalog and freeze column scaling from it.
+
+        Scaling is fixed here so later product inserts never shift existing
+        embeddings; call this before any products are added.
+        """
+        rows = len(catalog)
+        if rows == 0:
+            return
+        raw = np.zeros((rows, len(FEATURES)))
+        for i, feature in enumerate(FEATURES):
+            column = CATALOG_COLUMNS[feature]
+            if column in catalog.columns:
+                raw[:, i] = np.nan_to_num(np.asarray(catalog.column(column), dtype=float))
+        dishes = catalog.column("Dish")
+
+        with self._lock:
+            if rows > 1:
+                spread = raw.std(axis=0)
+                self._scale = np.where(spread > 0, spread, DEFAULT_SCALE)
+            # Rows already present were embedded with the old scale
+            self._embedded[:self._size] = self._embed(self._raw[:self._size])
+
+            self._reserve(rows)
+            start = self._size
+            for offset, dish in enumerate(dishes.tolist()):
+                key = f"{SOURCE_DISH}:{dish}"
+                self._positions[key] = start + offset
+                self._keys.append(key)
+                self._items.append({"name": dish, "source": SOURCE_DISH})
+            self._write_rows(start, raw, SOURCE_DISH)
+            self._size += rows
+
+    def add(self, key: str, item: dict, nutrients: dict, source: str = SOURCE_OFF,
+            category: str = None, countries=None):
+        """Insert or replace one item; it is embedded on the next query.
+
+        category and countries are kept on the item so queries can restrict
+        results to the same product category or to where it is sold.
+        """
+        entry = dict(item)
+        entry["source"] = source
+        entry["category"] = category
+        entry["countries"] = list(countries or [])
+        with self._lock:
+            self._pending[key] = (entry, nutrient_vector(nutrients))
+
+    def _flush(self):
+        """Embed pending inserts; costs O(pending), not O(index) (caller holds the lock)."""
+        if not self._pending:
+            return
+        new_rows = []
+        new_sources = []
+        for key, (item, vector) in self._pending.items():
+            if key in self._positions:
+                pos = self._positions[key]
+                self._items[pos] = item
+                self._write_rows(pos, vector[np.newaxis, :], item["source"])
+            else:
+                self._positions[key] = self._size + len(new_rows)
+                self._keys.append(key)
+                self._items.append(item)
+                new_rows.append(vector)
+                new_sources.append(item["source"])
+        if new_rows:
+            self._reserve(len(new_rows))
+            self._write_rows(self._size, np.array(new_rows), new_sources)
+            self._size += len(new_rows)
+        self._pending.clear()
+
+    def _embed(self, raw: np.ndarray):
+        scaled = raw / self._scale
+        norms = np.linalg.norm(scaled, axis=-1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return scaled / norms
+
+    def similar_healthier(self, nutrients: dict, k: int = 5, source: str = None,
+                          exclude_key: str = None, min_gain: float = DEFAULT_MIN_GAIN,
+                          min_similarity: float = DEFAULT_MIN_SIMILARITY,
+                          category: str = None, country: str = None):
+        """Return up to k items most similar to nutrients whose health score beats it by min_gain.
+
+        Only items with cosine similarity of at least min_similarity are
+        returned, and, when given, only those in the same category or sold in
+        country. An empty list means nothing local is a credible alternative.
+        """
+        query_raw = nutrient_vector(nutrients)
+        with self._lock:
+            self._flush()
+            if self._size == 0:
+                return []
+            query = self._embed(query_raw)
+            similarity = self._embedded[:self._size] @ query
+            query_health = health_scores(query_raw)[0]
+            mask = (similarity >= min_similarity) & (self._health[:self._size] >= query_health + min_gain)
+            if source is not None:
+                mask &= self._sources[:self._size] == source
+            if exclude_key is not None and exclude_key in self._positions:
+                mask[self._positions[exclude_key]] = False
+
+            candidates = np.flatnonzero(mask)
+            candidates = candidates[np.argsort(-similarity[candidates])]
+
+            results = []
+            for idx in candidates:
+                item = self._items[idx]
+                if category is not None and item.get("category") != category:
+                    continue
+                if country is not None and country not in item.get("countries", []):
+                    continue
+                result = dict(item)
+                result["similarity"] = round(float(similarity[idx]), 4)
+                result["health_score"] = round(float(self._health[idx]), 2)
+                results.append(result)
+                if len(results) == k:
+                    break
+            return results
@@ -1,28 +1,32 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Query, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from datetime import datetime, timedelta
-from typing import Dict, List
+from typing import Dict, List, Literal, Optional
 import json
 import cv2
 import numpy as np
 from pyzbar.pyzbar import decode, ZBarSymbol
 import base64
 import torch
-import torchvision.transforms as transforms
-import timm
-import torch.nn as nn
-from PIL import Image, ImageEnhance
+from PIL import Image
 import io
 import os
 import time
 import requests
 from pydantic import BaseModel
 import google.generativeai as genai
-from collections import Counter
-from meal_planner import generate_meal_plan
+from collections import Counter, OrderedDict
+from meal_planner import generate_meal_plan, PLANNER_COLUMNS
+from food_log import open_food_log, DEFAULT_USER
+from nutrition_catalog import load_nutrition_catalog
+from alternatives_index import AlternativesIndex, SOURCE_DISH, SOURCE_OFF
+from food_classifier import load_timm_model, enhance_image, build_preprocess, predict_top_k
+from rollups import open_rollups, MAX_COUNTS
+from admission import admission_from_env, Overloaded, PRIORITY_BARCODE, PRIORITY_CLASSIFY
 import pandas as pd
 
 # ------------------- FASTAPI SETUP -------------------
@@ -36,6 +40,22 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ------------------- ADMISSION CONTROL -------------------
+# Bounds how many image decodes / inferences run at once and how many may wait
+admission = admission_from_env()
+
+# Per-request time budgets (seconds); requests that cannot finish in time are shed early
+BARCODE_BUDGET_SECONDS = float(os.getenv("BARCODE_BUDGET_SECONDS", "5"))
+FOOD_DETECT_BUDGET_SECONDS = float(os.getenv("FOOD_DETECT_BUDGET_SECONDS", "15"))
+
+def shed_request(error: Overloaded):
+    """Turn an admission rejection into a fast 503 with a Retry-After hint."""
+    return HTTPException(
+        status_code=503,
+        detail=error.reason,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
 # ------------------- GOOGLE FIT SETUP -------------------
 SCOPES = [
     'https://www.googleapis.com/auth/fitness.activity.read',
@@ -48,10 +68,6 @@ def get_google_fit_service(credentials: Dict):
     creds = Credentials(**credentials)
     return build('fitness', 'v1', credentials=creds)
 
-# ImageNet mean and std for normalization
-IMAGENET_MEAN = [0.485, 0.456, 0.406]
-IMAGENET_STD = [0.229, 0.224, 0.225]
-
 # Set up device in a robust way
 device = torch.device("cpu")  # Default to CPU
 try:
@@ -79,57 +95,12 @@ MODEL_PATH = os.path.join(current_dir, "best_model.pth")
 food_model = None  # PyTorch model for food detection
 gemini_model = None  # Gemini model for barcode scanning
 
-# Function to create the model architecture
-def create_timm_model(num_classes: int):
-    """Create the Timm model architecture."""
-    model = timm.create_model('tf_efficientnetv2_s', pretrained=False)
-    in_features = model.classifier.in_features
-    model.classifier = nn.Linear(in_features, num_classes)
-    return model
-
-# Function to load the PyTorch model
-def load_timm_model(model_path: str):
-    """Load model checkpoint (including class names) and build the model architecture."""
-    if not os.path.exists(model_path):
-        print(f"Error: Model file {model_path} does not exist")
-        return None, None
-
-    print(f"Loading model from {model_path}")
-    try:
-        checkpoint = torch.load(model_path, map_location=device)
-        
-        # If the checkpoint has class_names
-        class_names = checkpoint.get('class_names', None)
-        if class_names is None:
-            print("Warning: 'class_names' not found in checkpoint. Using numeric class IDs.")
-            # Fallback: set some number of classes
-            num_classes = checkpoint.get('num_classes', 10)  # Default to 10 classes
-        else:
-            num_classes = len(class_names)
-            print(f"Found {num_classes} classes: {class_names}")
-
-        # Create model architecture
-        model = create_timm_model(num_classes)
-        
-        # Load the state dict - handle different checkpoint formats
-        if 'model_state_dict' in checkpoint:
-            model.load_state_dict(checkpoint['model_state_dict'])
-        else:
-            # Try loading directly
-            model.load_state_dict(checkpoint)
-            
-        model.eval()
-        print(f"Model loaded successfully with {num_classes} classes.")
-        return model, class_names
-    except Exception as e:
-        print(f"Error loading model: {e}")
-        import traceback
-        traceback.print_exc()
-        return None, None
+# Preprocessing pipeline for the food detection model (built once, reused per request)
+food_preprocess = build_preprocess()
 
 # Load the PyTorch model for food detection
 try:
-    food_model, class_names = load_timm_model(MODEL_PATH)
+    food_model, class_names = load_timm_model(MODEL_PATH, device)
     if food_model is not None:
         food_model = food_model.to(device)
         print(f"Food detection model loaded successfully to {device}")
@@ -153,18 +124,69 @@ except Exception as e:
     print(f"Error initializing Gemini model: {e}")
     gemini_model = None
 
-# Load nutrition data from CSV
+# Load nutrition data, preferring the memory-mapped columnar catalog over the CSV
 try:
     nutrition_csv_path = os.path.join(current_dir, "data", "nutrition_data.csv")
-    if os.path.exists(nutrition_csv_path):
-        nutrition_df = pd.read_csv(nutrition_csv_path)
-        print(f"Loaded nutrition data for {len(nutrition_df)} foods")
+    nutrition_catalog_dir = os.path.join(current_dir, "data", "nutrition_catalog")
+    nutrition_catalog = load_nutrition_catalog(nutrition_catalog_dir, nutrition_csv_path)
+    if nutrition_catalog is not None:
+        print(f"Loaded nutrition data for {len(nutrition_catalog)} foods")
     else:
-        nutrition_df = None
         print(f"WARNING: Nutrition data file not found at {nutrition_csv_path}")
 except Exception as e:
     print(f"Error loading nutrition data: {e}")
-    nutrition_df = None
+    nutrition_catalog = None
+
+# Build the local healthier-alternatives index from the nutrition catalog
+alternatives_index = AlternativesIndex()
+try:
+    if nutrition_catalog is not None:
+        alternatives_index.add_catalog(nutrition_catalog)
+        print(f"Alternatives index built with {len(alternatives_index)} dishes")
+except Exception as e:
+    print(f"Error building alternatives index: {e}")
+
+# Open Food Facts products already fetched, keyed by barcode (least recently used evicted first)
+OFF_PRODUCT_CACHE_SIZE = int(os.getenv("OFF_PRODUCT_CACHE_SIZE", "1024"))
+off_product_cache = OrderedDict()
+
+# Local alternatives are only offered if they are sold here (matches get_alternatives)
+ALTERNATIVES_COUNTRY = "en:india"
+
+# Open the food log store (seeded from food.csv on first run)
+try:
+    food_log_store = open_food_log(
+        os.path.join(current_dir, "data"),
+        seed_csv=os.path.join(current_dir, "data", "food.csv")
+    )
+    print(f"Food log store opened at {food_log_store.db_path}")
+except Exception as e:
+    print(f"Error opening food log store: {e}")
+    food_log_store = None
+
+# Attach the statistics rollups to the food log database (backfilled on first run)
+try:
+    rollup_store = None
+    if food_log_store is not None:
+        rollup_store = open_rollups(food_log_store)
+        print(f"Rollup store attached to {food_log_store.db_path}")
+except Exception as e:
+    print(f"Error opening rollup store: {e}")
+    rollup_store = None
+
+# Google Fit data is pulled into the rollups at most this often when the dashboard asks for them
+FITNESS_SYNC_INTERVAL_SECONDS = int(os.getenv("FITNESS_SYNC_INTERVAL_SECONDS", "3600"))
+last_fitness_sync = 0.0
+
+def record_activity(metric: str, daily_values: Dict[str, float]):
+    """Store per-day Google Fit totals in the rollups (fitness data belongs to the default user)."""
+    if rollup_store is None:
+        return
+    try:
+        for day, value in daily_values.items():
+            rollup_store.set_activity(DEFAULT_USER, day, **{metric: value})
+    except Exception as e:
+        print(f"Error recording {metric} rollups: {e}")
 
 # ------------------- GOOGLE OAUTH ENDPOINT -------------------
 @app.post("/auth/google")
@@ -190,9 +212,8 @@ async def google_auth():
         raise HTTPException(status_code=500, detail=f"Authentication failed: {str(e)}")
 
 # ------------------- GOOGLE FIT ENDPOINTS -------------------
-@app.get("/fitness/steps")
-async def get_steps():
-    """Get daily step count for the last 7 days."""
+# The Google Fit client blocks on the network, so fetches run in the threadpool
+def fetch_steps():
     if 'user' not in credentials_store:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -219,11 +240,10 @@ async def get_steps():
             steps = bucket['dataset'][0]['point'][0]['value'][0]['intVal']
         daily_steps.append({"date": date, "steps": steps})
     
+    record_activity("steps", {item["date"]: item["steps"] for item in daily_steps})
     return daily_steps
 
-@app.get("/fitness/sleep")
-async def get_sleep():
-    """Get sleep data for the last 7 days."""
+def fetch_sleep():
     if 'user' not in credentials_store:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -252,11 +272,14 @@ async def get_sleep():
                     "end_time": end.strftime('%H:%M'),
                     "duration_hours": (end - start).total_seconds() / 3600
                 })
+    
+    sleep_by_day = Counter()
+    for item in sleep_data:
+        sleep_by_day[item["date"]] += item["duration_hours"]
+    record_activity("sleep_hours", sleep_by_day)
     return sleep_data
 
-@app.get("/fitness/calories")
-async def get_calories():
-    """Get daily calorie burn data for the last 7 days."""
+def fetch_calories():
     if 'user' not in credentials_store:
         raise HTTPException(status_code=401, detail="Not authenticated")
     
@@ -282,14 +305,32 @@ async def get_calories():
         if bucket['dataset'][0]['point']:
             calories = bucket['dataset'][0]['point'][0]['value'][0]['fpVal']
         daily_calories.append({"date": date, "calories": round(calories, 2)})
+    
+    record_activity("calories_burned", {item["date"]: item["calories"] for item in daily_calories})
     return daily_calories
 
+@app.get("/fitness/steps")
+async def get_steps():
+    """Get daily step count for the last 7 days."""
+    return await run_in_threadpool(fetch_steps)
+
+@app.get("/fitness/sleep")
+async def get_sleep():
+    """Get sleep data for the last 7 days."""
+    return await run_in_threadpool(fetch_sleep)
+
+@app.get("/fitness/calories")
+async def get_calories():
+    """Get daily calorie burn data for the last 7 days."""
+    return await run_in_threadpool(fetch_calories)
+
 @app.get("/test")
 async def test_endpoint():
     """Simple test endpoint that doesn't require authentication."""
     return {
         "status": "API is working",
-        "authenticated": 'user' in credentials_store
+        "authenticated": 'user' in credentials_store,
+        "admission": admission.stats()
     }
 
 # ------------------- BARCODE SCAN ENDPOINT -------------------
@@ -303,79 +344,105 @@ genai.configure(api_key=GEMINI_API_KEY)
 # Initialize the Gemini model
 model = genai.GenerativeModel("gemini-2.0-flash")
 
+def save_request_image(image_base64: str, image_path: str):
+    """Decode a base64 upload and save it to disk for debugging. Returns (bytes, error)."""
+    try:
+        image_data = base64.b64decode(image_base64)
+        print(f"Image decoded successfully, size: {len(image_data)} bytes")
+    except Exception as e:
+        print(f"ERROR: Invalid image data: {str(e)}")
+        return None, f"Invalid image data: {str(e)}"
+    
+    os.makedirs(os.path.dirname(image_path), exist_ok=True)
+    with open(image_path, "wb") as f:
+        f.write(image_data)
+    print(f"Image saved to {image_path}")
+    return image_data, None
+
+def decode_and_scan_barcode(image_base64: str, image_dir: str, timestamp: int):
+    """Decode, save and scan an uploaded barcode image. Returns (data, type, error)."""
+    image_path = os.path.join(image_dir, f"barcode_image_{timestamp}.jpg")
+    image_data, error = save_request_image(image_base64, image_path)
+    if error:
+        return None, None, error
+    return decode_barcode_image(image_data, image_dir, timestamp)
+
+def decode_barcode_image(image_data: bytes, image_dir: str, timestamp: int):
+    """Decode image bytes and scan for a barcode. Returns (data, type, error)."""
+    try:
+        # Convert image to numpy array for OpenCV
+        nparr = np.frombuffer(image_data, np.uint8)
+        img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+        if img is None:
+            print("ERROR: Failed to decode image")
+            return None, None, "Failed to decode image"
+
+        print(f"Image loaded, shape: {img.shape}")
+
+        # Specify barcode types to scan
+        symbols_to_scan = [
+            ZBarSymbol.EAN13,
+            ZBarSymbol.UPCA,
+            ZBarSymbol.QRCODE,
+            ZBarSymbol.CODE39,
+            ZBarSymbol.CODE128,
+            ZBarSymbol.EAN8
+        ]
+
+        # Scan for barcodes
+        barcodes = decode(img, symbols=symbols_to_scan)
+
+        if not barcodes:
+            print("No barcodes found in image")
+            return None, None, "No barcode detected in the image"
+
+        # Get the first barcode (most prominent)
+        barcode = barcodes[0]
+        barcode_data = barcode.data.decode("utf-8")
+        barcode_type = barcode.type
+
+        print(f"Detected barcode: {barcode_type} - {barcode_data}")
+
+        # Draw rectangle around barcode and save for debugging
+        (x, y, w, h) = barcode.rect
+        cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(img, f"{barcode_type}: {barcode_data}", (x, y - 10), 
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+
+        debug_path = os.path.join(image_dir, f"barcode_detected_{timestamp}.jpg")
+        cv2.imwrite(debug_path, img)
+        print(f"Annotated image saved to {debug_path}")
+
+        return barcode_data, barcode_type, None
+    except Exception as e:
+        print(f"ERROR: Error processing image: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return None, None, f"Error processing image: {str(e)}"
+
 @app.post("/barcode-scan")
 async def scan_barcode(request: ImageRequest):
     try:
         print("\n----- BARCODE SCAN REQUEST RECEIVED -----")
         
-        # 1) Decode the base64 image
-        try:
-            image_data = base64.b64decode(request.imageBase64)
-            print(f"Image decoded successfully, size: {len(image_data)} bytes")
-        except Exception as e:
-            print(f"ERROR: Invalid image data: {str(e)}")
-            return {"success": False, "error": f"Invalid image data: {str(e)}"}
-        
-        # 2) Save image to disk for debugging
         image_dir = os.path.join(current_dir, "captured_barcodes")
-        os.makedirs(image_dir, exist_ok=True)
         timestamp = int(time.time())
-        image_path = os.path.join(image_dir, f"barcode_image_{timestamp}.jpg")
-        with open(image_path, "wb") as f:
-            f.write(image_data)
-        print(f"Image saved to {image_path}")
         
-        # 3) Convert to OpenCV format and scan for barcodes
+        # 1-3) Decode the base64 image, save it for debugging and scan for barcodes.
+        # All of it runs under an admission slot (off the event loop), so shed
+        # requests never allocate the image or touch the disk.
         try:
-            # Convert image to numpy array for OpenCV
-            nparr = np.frombuffer(image_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-            
-            if img is None:
-                print("ERROR: Failed to decode image")
-                return {"success": False, "error": "Failed to decode image"}
-            
-            print(f"Image loaded, shape: {img.shape}")
-            
-            # Specify barcode types to scan
-            symbols_to_scan = [
-                ZBarSymbol.EAN13,
-                ZBarSymbol.UPCA,
-                ZBarSymbol.QRCODE,
-                ZBarSymbol.CODE39,
-                ZBarSymbol.CODE128,
-                ZBarSymbol.EAN8
-            ]
-            
-            # Scan for barcodes
-            barcodes = decode(img, symbols=symbols_to_scan)
-            
-            if not barcodes:
-                print("No barcodes found in image")
-                return {"success": False, "error": "No barcode detected in the image"}
-            
-            # Get the first barcode (most prominent)
-            barcode = barcodes[0]
-            barcode_data = barcode.data.decode("utf-8")
-            barcode_type = barcode.type
-            
-            print(f"Detected barcode: {barcode_type} - {barcode_data}")
-            
-            # Draw rectangle around barcode and save for debugging
-            (x, y, w, h) = barcode.rect
-            cv2.rectangle(img, (x, y), (x + w, y + h), (0, 255, 0), 2)
-            cv2.putText(img, f"{barcode_type}: {barcode_data}", (x, y - 10), 
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-            
-            debug_path = os.path.join(image_dir, f"barcode_detected_{timestamp}.jpg")
-            cv2.imwrite(debug_path, img)
-            print(f"Annotated image saved to {debug_path}")
-            
-        except Exception as e:
-            print(f"ERROR: Error processing image: {str(e)}")
-            import traceback
-            traceback.print_exc()
-            return {"success": False, "error": f"Error processing image: {str(e)}"}
+            async with admission.slot(PRIORITY_BARCODE, BARCODE_BUDGET_SECONDS):
+                barcode_data, barcode_type, error = await run_in_threadpool(
+                    decode_and_scan_barcode, request.imageBase64, image_dir, timestamp
+                )
+        except Overloaded as e:
+            print(f"Shedding barcode scan: {e.reason}")
+            raise shed_request(e)
+        
+        if error:
+            return {"success": False, "error": error}
         
         # 4) Fetch product details from Open Food Facts API
         try:
@@ -393,7 +460,20 @@ async def scan_barcode(request: ImageRequest):
             # Check if product is available in India
             available_in_india = "en:india" in product_info.get("available_countries", [])
             
-            if "category" in product_info:
+            # Look for similar but healthier products in the local index first
+            # (same first category tag, sold in India, above the similarity cutoff);
+            # without a category tag, nutrients alone can't tell a drink from a snack
+            if product_info.get("category_tag"):
+                alternatives = alternatives_index.similar_healthier(
+                    product_info,
+                    k=5,
+                    source=SOURCE_OFF,
+                    exclude_key=f"{SOURCE_OFF}:{barcode_data}",
+                    category=product_info["category_tag"],
+                    country=ALTERNATIVES_COUNTRY
+                )
+            
+            if not alternatives and "category" in product_info:
                 # Try to get alternatives from Open Food Facts
                 alternatives = get_alternatives(product_info["category"])
             
@@ -434,14 +514,38 @@ async def scan_barcode(request: ImageRequest):
             traceback.print_exc()
             return {"success": False, "error": f"Error fetching product info: {str(e)}"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"CRITICAL ERROR: Unexpected error in barcode scanning: {str(e)}")
         import traceback
         traceback.print_exc()
         return {"success": False, "error": f"Unexpected error: {str(e)}"}
 
+# Helper to pull the per-100g nutrients we index out of an Open Food Facts product
+def off_nutrients(product):
+    nutrients = product.get("nutriments", {})
+    return {
+        "calories": nutrients.get("energy-kcal_100g", 0),
+        "protein": nutrients.get("proteins_100g", 0),
+        "carbs": nutrients.get("carbohydrates_100g", 0),
+        "fat": nutrients.get("fat_100g", 0),
+        "sugar": nutrients.get("sugars_100g", 0),
+        "fiber": nutrients.get("fiber_100g", 0),
+        "sodium": nutrients.get("sodium_100g", 0)
+    }
+
+# Helper to get a product's first (broadest) category tag, e.g. "en:beverages"
+def first_category_tag(product):
+    tags = product.get("categories_tags") or []
+    return tags[0] if tags else None
+
 # Helper function to get product info from Open Food Facts
 def get_product_info(barcode):
+    if barcode in off_product_cache:
+        off_product_cache.move_to_end(barcode)
+        return dict(off_product_cache[barcode])
+    
     url = f"https://world.openfoodfacts.org/api/v2/product/{barcode}.json"
     response = requests.get(url)
     
@@ -449,26 +553,38 @@ def get_product_info(barcode):
         data = response.json()
         if data.get("status") == 1:
             product = data["product"]
-            nutrients = product.get("nutriments", {})
             
             # Extract available countries
             countries_tags = product.get("countries_tags", [])
             
-            return {
+            product_info = {
                 "name": product.get("product_name", "N/A"),
                 "brand": product.get("brands", "N/A"),
                 "image": product.get("image_url", ""),
                 "category": product.get("categories", "N/A"),
+                "category_tag": first_category_tag(product),
                 "available_countries": countries_tags,
                 "servingSize": product.get("serving_size", "N/A"),
-                "calories": nutrients.get("energy-kcal_100g", 0),
-                "protein": nutrients.get("proteins_100g", 0),
-                "carbs": nutrients.get("carbohydrates_100g", 0),
-                "fat": nutrients.get("fat_100g", 0),
-                "sugar": nutrients.get("sugars_100g", 0),
-                "fiber": nutrients.get("fiber_100g", 0),
-                "sodium": nutrients.get("sodium_100g", 0)
+                **off_nutrients(product)
             }
+            
+            # Cache the record and make it available to the local alternatives index
+            off_product_cache[barcode] = dict(product_info)
+            while len(off_product_cache) > OFF_PRODUCT_CACHE_SIZE:
+                off_product_cache.popitem(last=False)
+            alternatives_index.add(
+                f"{SOURCE_OFF}:{barcode}",
+                {
+                    "name": product_info["name"],
+                    "brand": product_info["brand"],
+                    "barcode": barcode,
+                    "image": product_info["image"]
+                },
+                product_info,
+                category=product_info["category_tag"],
+                countries=countries_tags
+            )
+            return product_info
     return None
 
 # Function to fetch healthier alternatives available in India
@@ -485,12 +601,23 @@ def get_alternatives(category):
             data = response.json()
             for product in data.get("products", []):
                 if "en:india" in product.get("countries_tags", []):
-                    alternatives.append({
+                    alternative = {
                         "name": product.get("product_name", "Unknown"),
                         "brand": product.get("brands", "Unknown"),
                         "barcode": product.get("code", "N/A"),
                         "image": product.get("image_url", "")
-                    })
+                    }
+                    alternatives.append(alternative)
+                    
+                    # Index the product so later scans can be answered locally
+                    if product.get("code") and product.get("nutriments"):
+                        alternatives_index.add(
+                            f"{SOURCE_OFF}:{product['code']}",
+                            alternative,
+                            off_nutrients(product),
+                            category=first_category_tag(product),
+                            countries=product.get("countries_tags", [])
+                        )
         
         return alternatives[:5]  # Return top 5 alternatives
     except Exception as e:
@@ -533,6 +660,47 @@ def fetch_alternatives_using_gemini(product_name, category):
         return []
 
 # ------------------- FOOD DETECTION ENDPOINT -------------------
+def catalog_nutrition(food_idx: int):
+    """Read one dish's macros straight from the nutrition catalog columns."""
+    return {
+        "calories": int(nutrition_catalog.column('Calories (kcal)')[food_idx]),
+        "protein": int(nutrition_catalog.column('Protein (g)')[food_idx]),
+        "carbs": int(nutrition_catalog.column('Carbohydrates (g)')[food_idx]),
+        "fat": int(nutrition_catalog.column('Fat (g)')[food_idx])
+    }
+
+def classify_food_image(image_path: str, image_dir: str, timestamp: int):
+    """Enhance, preprocess and classify a saved food image. Returns top-3 predictions."""
+    image_pil = Image.open(image_path).convert('RGB')
+    print(f"Image opened, size: {image_pil.size}")
+
+    # Apply image enhancement techniques
+    image_pil = enhance_image(image_pil)
+
+    # Save enhanced image for debugging
+    enhanced_path = os.path.join(image_dir, f"enhanced_{timestamp}.jpg")
+    image_pil.save(enhanced_path)
+    print(f"Enhanced image saved to {enhanced_path}")
+
+    # Preprocess for PyTorch model and move tensor to the same device as the model
+    image_tensor = food_preprocess(image_pil).unsqueeze(0).to(device)
+    print(f"Image preprocessed, tensor shape: {image_tensor.shape}, device: {image_tensor.device}")
+
+    # Run inference and map the top-3 classes to names
+    predictions = predict_top_k(food_model, image_tensor, class_names, k=3)
+    for i, pred in enumerate(predictions):
+        print(f"Prediction {i+1}: {pred['name']} with confidence {pred['confidence']:.2f}%")
+
+    return predictions
+
+def decode_and_classify_food(image_base64: str, image_dir: str, timestamp: int):
+    """Decode, save and classify an uploaded food image. Returns (predictions, error)."""
+    image_path = os.path.join(image_dir, f"food_image_{timestamp}.jpg")
+    _, error = save_request_image(image_base64, image_path)
+    if error:
+        return None, error
+    return classify_food_image(image_path, image_dir, timestamp), None
+
 @app.post("/food-detect")
 async def detect_food(request: ImageRequest):
     try:
@@ -543,139 +711,76 @@ async def detect_food(request: ImageRequest):
             print("ERROR: Food detection model not loaded")
             return {"success": False, "error": "Food detection model not loaded"}
         
-        # 1) Decode the base64 image
-        try:
-            image_data = base64.b64decode(request.imageBase64)
-            print(f"Image decoded successfully, size: {len(image_data)} bytes")
-        except Exception as e:
-            print(f"ERROR: Invalid image data: {str(e)}")
-            return {"success": False, "error": f"Invalid image data: {str(e)}"}
-        
-        # 2) Save image to disk for debugging
         image_dir = os.path.join(current_dir, "captured_images")
-        os.makedirs(image_dir, exist_ok=True)
         timestamp = int(time.time())
-        image_path = os.path.join(image_dir, f"food_image_{timestamp}.jpg")
-        with open(image_path, "wb") as f:
-            f.write(image_data)
-        print(f"Image saved to {image_path}")
         
-        # 3) Preprocess the image
         try:
-            image_pil = Image.open(image_path).convert('RGB')
-            print(f"Image opened, size: {image_pil.size}")
-            
-            # Apply image enhancement techniques
-            enhancer = ImageEnhance.Contrast(image_pil)
-            image_pil = enhancer.enhance(1.5)  # Increase contrast by 50%
-            
-            enhancer = ImageEnhance.Sharpness(image_pil)
-            image_pil = enhancer.enhance(1.5)  # Increase sharpness by 50%
-            
-            enhancer = ImageEnhance.Color(image_pil)
-            image_pil = enhancer.enhance(1.2)  # Increase color saturation by 20%
-            
-            # Save enhanced image for debugging
-            enhanced_path = os.path.join(image_dir, f"enhanced_{timestamp}.jpg")
-            image_pil.save(enhanced_path)
-            print(f"Enhanced image saved to {enhanced_path}")
-            
-            # Preprocess for PyTorch model
-            preprocess = transforms.Compose([
-                transforms.Resize((384, 384)),
-                transforms.ToTensor(),
-                transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
-            ])
-            
-            # Move tensor to the same device as the model
-            image_tensor = preprocess(image_pil).unsqueeze(0).to(device)
-            print(f"Image preprocessed, tensor shape: {image_tensor.shape}, device: {image_tensor.device}")
-            
-            # Run inference with PyTorch model
-            with torch.no_grad():
-                outputs = food_model(image_tensor)
-                probabilities = torch.nn.functional.softmax(outputs, dim=1)
-                
-                # Top-1
-                conf, pred_idx = torch.max(probabilities, 1)
-                predicted_idx = pred_idx.item()
-                confidence_value = conf.item()
-                
-                print(f"Top prediction: Class {predicted_idx} with confidence {confidence_value:.4f}")
-                
-                # Top-3
-                if class_names:
-                    topk = min(3, len(class_names))
-                else:
-                    topk = 3
-                top3_prob, top3_indices = torch.topk(probabilities, topk, dim=1)
-                
-                # Map indices to class names
-                predictions = []
-                if class_names:
-                    for i in range(top3_indices.shape[1]):
-                        idx = top3_indices[0][i].item()
-                        conf_val = top3_prob[0][i].item() * 100
-                        if idx < len(class_names):
-                            pred_name = class_names[idx]
-                        else:
-                            pred_name = f"Class_{idx}"
-                        predictions.append({"name": pred_name, "confidence": conf_val})
-                        print(f"Prediction {i+1}: {pred_name} with confidence {conf_val:.2f}%")
-                else:
-                    # Fallback if no class_names
-                    for i in range(top3_indices.shape[1]):
-                        idx = top3_indices[0][i].item()
-                        conf_val = top3_prob[0][i].item() * 100
-                        predictions.append({"name": f"Class_{idx}", "confidence": conf_val})
-                
-                if predictions:
-                    top_food = predictions[0]["name"]
-                else:
-                    top_food = "Unknown Food"
+            # 1-3) Decode the base64 image, save it for debugging, then enhance, preprocess
+            # and classify it. All of it runs under an admission slot (off the event loop),
+            # so shed requests never allocate the image or touch the disk.
+            try:
+                async with admission.slot(PRIORITY_CLASSIFY, FOOD_DETECT_BUDGET_SECONDS):
+                    predictions, error = await run_in_threadpool(
+                        decode_and_classify_food, request.imageBase64, image_dir, timestamp
+                    )
+            except Overloaded as e:
+                print(f"Shedding food detection: {e.reason}")
+                raise shed_request(e)
+            
+            if error:
+                return {"success": False, "error": error}
+            
+            if predictions:
+                top_food = predictions[0]["name"]
+            else:
+                top_food = "Unknown Food"
             
-            # Get nutrition data from CSV instead of hardcoded dictionary
-            if nutrition_df is not None:
+            # Get nutrition data from the nutrition catalog instead of hardcoded dictionary
+            if nutrition_catalog is not None:
                 # Clean up food name for matching (remove spaces, lowercase)
                 top_food_clean = top_food.lower().replace(' ', '_')
                 
-                # Try to find the food in the nutrition dataframe
-                food_row = nutrition_df[nutrition_df['Dish'].str.lower() == top_food_clean]
+                # Try to find the food in the nutrition catalog
+                food_idx = nutrition_catalog.find(top_food_clean)
                 
-                if not food_row.empty:
+                matched_dish = None
+                if food_idx is not None:
                     # Food found in nutrition data
-                    nutrition = {
-                        "calories": int(food_row['Calories (kcal)'].values[0]),
-                        "protein": int(food_row['Protein (g)'].values[0]),
-                        "carbs": int(food_row['Carbohydrates (g)'].values[0]),
-                        "fat": int(food_row['Fat (g)'].values[0])
-                    }
-                    print(f"Found nutrition data for {top_food} in CSV: {nutrition}")
+                    matched_dish = nutrition_catalog.column('Dish')[food_idx]
+                    nutrition = catalog_nutrition(food_idx)
+                    print(f"Found nutrition data for {top_food} in catalog: {nutrition}")
                 else:
                     # Try fuzzy matching if exact match fails
                     from difflib import get_close_matches
-                    all_dishes = nutrition_df['Dish'].str.lower().tolist()
+                    all_dishes = nutrition_catalog.keys()
                     matches = get_close_matches(top_food_clean, all_dishes, n=1, cutoff=0.6)
                     
                     if matches:
                         closest_match = matches[0]
-                        food_row = nutrition_df[nutrition_df['Dish'].str.lower() == closest_match]
-                        nutrition = {
-                            "calories": int(food_row['Calories (kcal)'].values[0]),
-                            "protein": int(food_row['Protein (g)'].values[0]),
-                            "carbs": int(food_row['Carbohydrates (g)'].values[0]),
-                            "fat": int(food_row['Fat (g)'].values[0])
-                        }
-                        print(f"Found close match '{closest_match}' for '{top_food}' in CSV: {nutrition}")
+                        food_idx = nutrition_catalog.find(closest_match)
+                        matched_dish = nutrition_catalog.column('Dish')[food_idx]
+                        nutrition = catalog_nutrition(food_idx)
+                        print(f"Found close match '{closest_match}' for '{top_food}' in catalog: {nutrition}")
                     else:
                         # Fallback to zeros if no match found
                         nutrition = {"calories": 0, "protein": 0, "carbs": 0, "fat": 0}
-                        print(f"No nutrition data found for {top_food} in CSV")
+                        print(f"No nutrition data found for {top_food} in catalog")
             else:
                 # Fallback to zeros if nutrition data not loaded
+                matched_dish = None
                 nutrition = {"calories": 0, "protein": 0, "carbs": 0, "fat": 0}
                 print(f"No nutrition database available for {top_food}")
             
+            # Similar but healthier dishes from the local alternatives index
+            alternatives = []
+            if matched_dish is not None:
+                alternatives = alternatives_index.similar_healthier(
+                    nutrition,
+                    k=5,
+                    source=SOURCE_DISH,
+                    exclude_key=f"{SOURCE_DISH}:{matched_dish}"
+                )
+            
             response_data = {
                 "success": True,
                 "food": {
@@ -684,26 +789,126 @@ async def detect_food(request: ImageRequest):
                     "protein": nutrition["protein"],
                     "carbs": nutrition["carbs"],
                     "fat": nutrition["fat"]
-                }
+                },
+                "alternatives": alternatives
             }
             print(f"Returning response: {response_data}")
             return response_data
             
+        except HTTPException:
+            raise
         except Exception as e:
             print(f"ERROR: Error processing image: {str(e)}")
             import traceback
             traceback.print_exc()
             return {"success": False, "error": f"Error processing image: {str(e)}"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"CRITICAL ERROR: Unexpected error in food detection: {str(e)}")
         import traceback
         traceback.print_exc()
         return {"success": False, "error": f"Unexpected error: {str(e)}"}
 
+# ------------------- FOOD LOG ENDPOINTS -------------------
+def validate_date(value: Optional[str], name: str = "date"):
+    """Reject anything but a zero-padded YYYY-MM-DD date (stored dates are compared as strings)."""
+    if value is None:
+        return None
+    try:
+        parsed = datetime.strptime(value, '%Y-%m-%d')
+    except ValueError:
+        parsed = None
+    if parsed is None or parsed.strftime('%Y-%m-%d') != value:
+        raise HTTPException(status_code=400, detail=f"{name} must be in YYYY-MM-DD format")
+    return value
+
+class FoodLogEntry(BaseModel):
+    user_id: str = DEFAULT_USER
+    date: Optional[str] = None  # YYYY-MM-DD, defaults to today
+    meal: Literal["B", "L", "D", "S"]  # Breakfast, Lunch, Dinner or Snack
+    food: str
+    protein: float = 0
+    calories: float = 0
+    fats: float = 0
+    carbs: float = 0
+
+@app.post("/food-log")
+async def add_food_log_entry(entry: FoodLogEntry):
+    """Append an entry to the user's food log and update their running aggregates."""
+    if food_log_store is None:
+        raise HTTPException(status_code=500, detail="Food log store not available")
+    entry_date = validate_date(entry.date) or datetime.now().strftime('%Y-%m-%d')
+    
+    # The entry, its running aggregates and its rollups are written in one transaction
+    logged = food_log_store.add_entry(
+        entry.user_id,
+        entry_date,
+        entry.meal,
+        entry.food,
+        protein=entry.protein,
+        calories=entry.calories,
+        fats=entry.fats,
+        carbs=entry.carbs
+    )
+    return logged
+
+@app.get("/food-log")
+async def get_food_log(user_id: str = DEFAULT_USER, start_date: Optional[str] = None, end_date: Optional[str] = None):
+    """Get a user's logged entries, optionally within an inclusive date range."""
+    if food_log_store is None:
+        raise HTTPException(status_code=500, detail="Food log store not available")
+    validate_date(start_date, "start_date")
+    validate_date(end_date, "end_date")
+    return food_log_store.get_entries(user_id, start_date, end_date)
+
+@app.get("/food-log/stats")
+async def get_food_log_stats(user_id: str = DEFAULT_USER):
+    """Get a user's precomputed intake totals, averages and dish frequencies."""
+    if food_log_store is None:
+        raise HTTPException(status_code=500, detail="Food log store not available")
+    return food_log_store.get_stats(user_id)
+
+# ------------------- STATISTICS ROLLUP ENDPOINT -------------------
+def fitness_sync_due():
+    """True (and claims the sync) if Google Fit data was last pulled longer than the interval ago."""
+    global last_fitness_sync
+    if 'user' not in credentials_store or time.time() - last_fitness_sync < FITNESS_SYNC_INTERVAL_SECONDS:
+        return False
+    last_fitness_sync = time.time()
+    return True
+
+def sync_fitness_rollups():
+    """Pull recent Google Fit data into the rollups (blocking; run as a background task)."""
+    for fetch in (fetch_steps, fetch_sleep, fetch_calories):
+        try:
+            fetch()
+        except Exception as e:
+            print(f"Error syncing fitness data for rollups: {e}")
+
+@app.get("/stats/rollup")
+async def get_stats_rollup(background_tasks: BackgroundTasks,
+                           user_id: str = DEFAULT_USER,
+                           granularity: Literal["daily", "weekly", "monthly"] = "daily",
+                           count: Optional[int] = Query(None, ge=1, le=max(MAX_COUNTS.values())),
+                           end_date: Optional[str] = None):
+    """Get precomputed daily/weekly/monthly activity, sleep and intake aggregates with goal streaks."""
+    if rollup_store is None:
+        raise HTTPException(status_code=500, detail="Rollup store not available")
+    validate_date(end_date, "end_date")
+    # Refresh fitness data after responding; the next read picks it up
+    if user_id == DEFAULT_USER and fitness_sync_due():
+        background_tasks.add_task(sync_fitness_rollups)
+    try:
+        return rollup_store.get_rollup(user_id, granularity, count, end_date)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # ------------------- MEAL PLANNER ENDPOINT -------------------
 class CalorieRequest(BaseModel):
     target_calories: int = 2000
+    user_id: str = DEFAULT_USER
 
 @app.post("/meal-plan")
 async def create_meal_plan(request: CalorieRequest):
@@ -716,17 +921,34 @@ async def create_meal_plan(request: CalorieRequest):
         dishes_csv = os.path.join(DATA_DIR, "nutrition_data.csv")
         history_csv = os.path.join(DATA_DIR, "food.csv")
         
-        # Check if files exist
-        if not os.path.exists(dishes_csv):
+        # Reuse the catalog loaded at startup instead of re-parsing the dishes CSV
+        if nutrition_catalog is not None:
+            # Only the planner's columns are copied out of the memory-mapped catalog
+            dishes_df = nutrition_catalog.to_frame(
+                [col for col in PLANNER_COLUMNS if col in nutrition_catalog.columns]
+            )
+        elif os.path.exists(dishes_csv):
+            dishes_df = None
+        else:
             raise HTTPException(status_code=500, detail=f"File not found: {dishes_csv}")
-        if not os.path.exists(history_csv):
-            raise HTTPException(status_code=500, detail=f"File not found: {history_csv}")
         
-        meal_plan = generate_meal_plan(
-            dishes_csv=dishes_csv,
-            history_csv=history_csv,
-            target_calories=request.target_calories
-        )
+        if food_log_store is not None:
+            # Planner reads the store's running aggregates instead of rescanning history
+            meal_plan = generate_meal_plan(
+                dishes_csv=dishes_csv,
+                target_calories=request.target_calories,
+                history_stats=food_log_store.get_stats(request.user_id),
+                dishes_df=dishes_df
+            )
+        else:
+            if not os.path.exists(history_csv):
+                raise HTTPException(status_code=500, detail=f"File not found: {history_csv}")
+            meal_plan = generate_meal_plan(
+                dishes_csv=dishes_csv,
+                history_csv=history_csv,
+                target_calories=request.target_calories,
+                dishes_df=dishes_df
+            )
         return meal_plan
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
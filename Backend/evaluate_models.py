@@ -0,0 +1,235 @@
+"""Offline accuracy-vs-latency evaluation of food classification configurations.
+
+Runs a labeled image folder (one sub-folder per class) through the same
+pipeline as /food-detect for every checkpoint x preprocessing preset, spread
+over a process pool, and reports top-1/top-3 accuracy, throughput and latency
+percentiles side by side. Results are written as JSON so a later run can be
+compared against them with --baseline.
+
+    python evaluate_models.py path/to/labeled_images --checkpoint best_model.pth \\
+        --presets production,no_enhance --output eval_results.json
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import torch
+from PIL import Image
+
+from food_classifier import DEFAULT_IMAGE_SIZE, load_timm_model, enhance_image, build_preprocess, predict_top_k
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Preprocessing presets; "production" matches what /food-detect does today
+PRESETS = {
+    "production": {"enhance": True, "image_size": DEFAULT_IMAGE_SIZE},
+    "no_enhance": {"enhance": False, "image_size": DEFAULT_IMAGE_SIZE},
+    "enhance_320": {"enhance": True, "image_size": 320},
+    "no_enhance_320": {"enhance": False, "image_size": 320},
+    "no_enhance_256": {"enhance": False, "image_size": 256}
+}
+
+# Per-worker state, filled by the pool initializer
+_worker_models = {}
+_worker_preprocess = {}
+
+
+def normalize_label(name: str):
+    """Match folder names and class names the same way /food-detect matches dishes."""
+    return name.strip().lower().replace(" ", "_")
+
+
+def find_images(image_dir: str):
+    """Return (path, label) pairs from an image_dir/<class_name>/<image> layout."""
+    samples = []
+    for label in sorted(os.listdir(image_dir)):
+        class_dir = os.path.join(image_dir, label)
+        if not os.path.isdir(class_dir):
+            continue
+        for filename in sorted(os.listdir(class_dir)):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                samples.append((os.path.join(class_dir, filename), label))
+    return samples
+
+
+def _init_worker(checkpoints):
+    # One intra-op thread per process so workers don't fight over cores
+    torch.set_num_threads(1)
+    for checkpoint in checkpoints:
+        model, class_names = load_timm_model(checkpoint)
+        if model is None:
+            raise RuntimeError(f"Could not load checkpoint {checkpoint}")
+        _worker_models[checkpoint] = (model, class_names)
+
+
+def _classify(task):
+    """Run one image through one configuration; returns (label, predicted names, latency seconds)."""
+    checkpoint, enhance, image_size, image_path, label = task
+    model, class_names = _worker_models[checkpoint]
+    if image_size not in _worker_preprocess:
+        _worker_preprocess[image_size] = build_preprocess(image_size)
+
+    start = time.perf_counter()
+    image_pil = Image.open(image_path).convert('RGB')
+    if enhance:
+        image_pil = enhance_image(image_pil)
+    image_tensor = _worker_preprocess[image_size](image_pil).unsqueeze(0)
+    predictions = predict_top_k(model, image_tensor, class_names, k=3)
+    latency = time.perf_counter() - start
+    return label, [pred["name"] for pred in predictions], latency
+
+
+def summarize(results, wall_seconds: float):
+    """Aggregate per-image results into accuracy, confusion and latency figures."""
+    top1 = top3 = 0
+    confusion = defaultdict(Counter)
+    per_class = defaultdict(lambda: {"support": 0, "top1": 0, "top3": 0})
+    latencies = []
+
+    for label, names, latency in results:
+        truth = normalize_label(label)
+        predicted = [normalize_label(name) for name in names]
+        hit1 = bool(predicted) and predicted[0] == truth
+        hit3 = truth in predicted
+        top1 += hit1
+        top3 += hit3
+        confusion[truth][predicted[0] if predicted else "none"] += 1
+        per_class[truth]["support"] += 1
+        per_class[truth]["top1"] += hit1
+        per_class[truth]["top3"] += hit3
+        latencies.append(latency * 1000)
+
+    count = len(results)
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    return {
+        "images": count,
+        "top1": top1 / count if count else 0.0,
+        "top3": top3 / count if count else 0.0,
+        "throughput_ips": count / wall_seconds if wall_seconds > 0 else 0.0,
+        "latency_ms": {
+            "mean": float(latencies.mean()),
+            "p50": float(np.percentile(latencies, 50)),
+            "p90": float(np.percentile(latencies, 90)),
+            "p99": float(np.percentile(latencies, 99))
+        },
+        "per_class": {
+            name: {
+                "support": stats["support"],
+                "top1": stats["top1"] / stats["support"],
+                "top3": stats["top3"] / stats["support"]
+            }
+            for name, stats in sorted(per_class.items())
+        },
+        "confusion": {truth: dict(preds) for truth, preds in sorted(confusion.items())}
+    }
+
+
+def evaluate(image_dir: str, checkpoints, presets, workers: int):
+    samples = find_images(image_dir)
+    if not samples:
+        raise ValueError(f"No labeled images found under {image_dir}")
+
+    configurations = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(checkpoints,)) as pool:
+        for checkpoint in checkpoints:
+            for preset in presets:
+                settings = PRESETS[preset]
+                name = f"{os.path.splitext(os.path.basename(checkpoint))[0]}/{preset}"
+                tasks = [
+                    (checkpoint, settings["enhance"], settings["image_size"], path, label)
+                    for path, label in samples
+                ]
+                print(f"Evaluating {name} on {len(tasks)} images with {workers} workers...")
+                start = time.perf_counter()
+                results = list(pool.map(_classify, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+                wall_seconds = time.perf_counter() - start
+
+                summary = summarize(results, wall_seconds)
+                summary.update({"checkpoint": checkpoint, "preset": preset, **settings})
+                configurations[name] = summary
+
+    return {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "image_dir": os.path.abspath(image_dir),
+        "images": len(samples),
+        "workers": workers,
+        "configurations": configurations
+    }
+
+
+def print_table(report, baseline=None):
+    header = f"{'configuration':<32} {'top1':>7} {'top3':>7} {'img/s':>8} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}"
+    if baseline:
+        header += f" {'Δtop1':>7} {'Δp99 ms':>8}"
+    print(header)
+    print("-" * len(header))
+    for name, conf in report["configurations"].items():
+        latency = conf["latency_ms"]
+        line = (f"{name:<32} {conf['top1']:>7.2%} {conf['top3']:>7.2%} {conf['throughput_ips']:>8.2f} "
+                f"{latency['p50']:>8.1f} {latency['p90']:>8.1f} {latency['p99']:>8.1f}")
+        previous = (baseline or {}).get("configurations", {}).get(name)
+        if previous:
+            line += (f" {conf['top1'] - previous['top1']:>+7.2%}"
+                     f" {latency['p99'] - previous['latency_ms']['p99']:>+8.1f}")
+        elif baseline:
+            line += f" {'new':>7} {'':>8}"
+        print(line)
+
+
+def find_regressions(report, baseline, max_top1_drop: float):
+    """Names of configurations whose top-1 accuracy fell more than max_top1_drop vs the baseline."""
+    regressions = []
+    for name, conf in report["configurations"].items():
+        previous = baseline.get("configurations", {}).get(name)
+        if previous and previous["top1"] - conf["top1"] > max_top1_drop:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare food classification configurations on a labeled image folder.")
+    parser.add_argument("image_dir", help="Folder with one sub-folder of images per class")
+    parser.add_argument("--checkpoint", action="append",
+                        help="Model checkpoint to evaluate (repeatable, default: best_model.pth)")
+    parser.add_argument("--presets", default=",".join(PRESETS),
+                        help=f"Comma-separated preprocessing presets ({', '.join(PRESETS)})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes (default: CPU count)")
+    parser.add_argument("--output", default="eval_results.json", help="Where to write the JSON report")
+    parser.add_argument("--baseline", help="Previous JSON report to compare against")
+    parser.add_argument("--max-top1-drop", type=float, default=0.01,
+                        help="Exit non-zero if any configuration's top-1 drops more than this vs the baseline")
+    args = parser.parse_args()
+
+    checkpoints = args.checkpoint or [os.path.join(os.path.dirname(os.path.abspath(__file__)), "best_model.pth")]
+    presets = [preset.strip() for preset in args.presets.split(",") if preset.strip()]
+    unknown = [preset for preset in presets if preset not in PRESETS]
+    if unknown:
+        parser.error(f"Unknown presets: {', '.join(unknown)}")
+
+    report = evaluate(args.image_dir, checkpoints, presets, max(1, args.workers))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print_table(report, baseline)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.output}")
+
+    if baseline:
+        regressions = find_regressions(report, baseline, args.max_top1_drop)
+        if regressions:
+            print(f"Top-1 regressions vs baseline: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Food classification model loading, preprocessing and top-k mapping.
+
+Shared by the /food-detect endpoint and the offline evaluation harness so both
+run exactly the same pipeline.
+"""
+import os
+
+import timm
+import torch
+import torch.nn as nn
+import torchvision.transforms as transforms
+from PIL import ImageEnhance
+
+# ImageNet mean and std for normalization
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+# Input resolution the production checkpoint was trained at
+DEFAULT_IMAGE_SIZE = 384
+
+
+# Function to create the model architecture
+def create_timm_model(num_classes: int):
+    """Create the Timm model architecture."""
+    model = timm.create_model('tf_efficientnetv2_s', pretrained=False)
+    in_features = model.classifier.in_features
+    model.classifier = nn.Linear(in_features, num_classes)
+    return model
+
+
+# Function to load the PyTorch model
+def load_timm_model(model_path: str, device=torch.device("cpu")):
+    """Load model checkpoint (including class names) and build the model architecture."""
+    if not os.path.exists(model_path):
+        print(f"Error: Model file {model_path} does not exist")
+        return None, None
+
+    print(f"Loading model from {model_path}")
+    try:
+        checkpoint = torch.load(model_path, map_location=device)
+
+        # If the checkpoint has class_names
+        class_names = checkpoint.get('class_names', None)
+        if class_names is None:
+            print("Warning: 'class_names' not found in checkpoint. Using numeric class IDs.")
+            # Fallback: set some number of classes
+            num_classes = checkpoint.get('num_classes', 10)  # Default to 10 classes
+        else:
+            num_classes = len(class_names)
+            print(f"Found {num_classes} classes: {class_names}")
+
+        # Create model architecture
+        model = create_timm_model(num_classes)
+
+        # Load the state dict - handle different checkpoint formats
+        if 'model_state_dict' in checkpoint:
+            model.load_state_dict(checkpoint['model_state_dict'])
+        else:
+            # Try loading directly
+            model.load_state_dict(checkpoint)
+
+        model.eval()
+        print(f"Model loaded successfully with {num_classes} classes.")
+        return model, class_names
+    except Exception as e:
+        print(f"Error loading model: {e}")
+        import traceback
+        traceback.print_exc()
+        return None, None
+
+
+def enhance_image(image_pil):
+    """Apply the contrast / sharpness / colour boost used before classification."""
+    enhancer = ImageEnhance.Contrast(image_pil)
+    image_pil = enhancer.enhance(1.5)  # Increase contrast by 50%
+
+    enhancer = ImageEnhance.Sharpness(image_pil)
+    image_pil = enhancer.enhance(1.5)  # Increase sharpness by 50%
+
+    enhancer = ImageEnhance.Color(image_pil)
+    image_pil = enhancer.enhance(1.2)  # Increase color saturation by 20%
+    return image_pil
+
+
+def build_preprocess(image_size: int = DEFAULT_IMAGE_SIZE):
+    """Resize, tensorize and normalize a PIL image for the model."""
+    return transforms.Compose([
+        transforms.Resize((image_size, image_size)),
+        transforms.ToTensor(),
+        transforms.Normalize(IMAGENET_MEAN, IMAGENET_STD)
+    ])
+
+
+def predict_top_k(model, image_tensor, class_names=None, k: int = 3):
+    """Run the model on a batch of one and map the top-k classes to names and confidences (%)."""
+    with torch.no_grad():
+        outputs = model(image_tensor)
+        probabilities = torch.nn.functional.softmax(outputs, dim=1)
+
+        if class_names:
+            k = min(k, len(class_names))
+        k = min(k, probabilities.shape[1])
+        topk_prob, topk_indices = torch.topk(probabilities, k, dim=1)
+
+    # Map indices to class names
+    predictions = []
+    for i in range(topk_indices.shape[1]):
+        idx = topk_indices[0][i].item()
+        conf_val = topk_prob[0][i].item() * 100
+        if class_names and idx < len(class_names):
+            pred_name = class_names[idx]
+        else:
+            pred_name = f"Class_{idx}"
+        predictions.append({"name": pred_name, "confidence": conf_val})
+    return predictions
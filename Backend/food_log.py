@@ -0,0 +1,185 @@
+import csv
+import os
+import sqlite3
+import threading
+
+DEFAULT_USER = "default"
+
+# Nutrient columns kept per entry, matching the headers of data/food.csv
+NUTRIENT_COLUMNS = ("protein", "calories", "fats", "carbs")
+
+
+class FoodLogStore:
+    """SQLite-backed food log with per-user running aggregates.
+
+    Every insert updates the user's totals and dish frequencies in the same
+    transaction, so readers such as the meal planner get averages and favourite
+    dishes from two small lookups instead of rescanning the whole history.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # Optional RollupStore updated inside each insert transaction (see rollups.open_rollups)
+        self.rollups = None
+        self._create_tables()
+
+    @property
+    def connection(self):
+        return self._conn
+
+    @property
+    def lock(self):
+        return self._lock
+
+    def _create_tables(self):
+        with self._lock, self._conn:
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS food_log (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    meal TEXT NOT NULL,
+                    food TEXT NOT NULL,
+                    protein REAL NOT NULL DEFAULT 0,
+                    calories REAL NOT NULL DEFAULT 0,
+                    fats REAL NOT NULL DEFAULT 0,
+                    carbs REAL NOT NULL DEFAULT 0
+                );
+                CREATE INDEX IF NOT EXISTS idx_food_log_user_date ON food_log (user_id, date);
+                CREATE INDEX IF NOT EXISTS idx_food_log_date ON food_log (date);
+
+                CREATE TABLE IF NOT EXISTS user_totals (
+                    user_id TEXT PRIMARY KEY,
+                    entries INTEGER NOT NULL DEFAULT 0,
+                    protein REAL NOT NULL DEFAULT 0,
+                    calories REAL NOT NULL DEFAULT 0,
+                    fats REAL NOT NULL DEFAULT 0,
+                    carbs REAL NOT NULL DEFAULT 0
+                );
+
+                CREATE TABLE IF NOT EXISTS dish_counts (
+                    user_id TEXT NOT NULL,
+                    dish TEXT NOT NULL,
+                    count INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, dish)
+                );
+            """)
+
+    def _insert(self, user_id, entry_date, meal, food, protein, calories, fats, carbs):
+        """Insert one entry and fold it into the running aggregates (caller holds the transaction)."""
+        cursor = self._conn.execute(
+            "INSERT INTO food_log (user_id, date, meal, food, protein, calories, fats, carbs) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, entry_date, meal, food, protein, calories, fats, carbs)
+        )
+        self._conn.execute(
+            "INSERT INTO user_totals (user_id, entries, protein, calories, fats, carbs) "
+            "VALUES (?, 1, ?, ?, ?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET "
+            "entries = entries + 1, "
+            "protein = protein + excluded.protein, "
+            "calories = calories + excluded.calories, "
+            "fats = fats + excluded.fats, "
+            "carbs = carbs + excluded.carbs",
+            (user_id, protein, calories, fats, carbs)
+        )
+        self._conn.execute(
+            "INSERT INTO dish_counts (user_id, dish, count) VALUES (?, ?, 1) "
+            "ON CONFLICT (user_id, dish) DO UPDATE SET count = count + 1",
+            (user_id, food)
+        )
+        if self.rollups is not None:
+            self.rollups.record_food(user_id, entry_date, protein, calories, fats, carbs)
+        return cursor.lastrowid
+
+    def add_entry(self, user_id, entry_date, meal, food, protein=0, calories=0, fats=0, carbs=0):
+        """Log a single food entry and return it with its new id."""
+        with self._lock, self._conn:
+            entry_id = self._insert(user_id, entry_date, meal, food, protein, calories, fats, carbs)
+        return {
+            "id": entry_id,
+            "user_id": user_id,
+            "date": entry_date,
+            "meal": meal,
+            "food": food,
+            "protein": protein,
+            "calories": calories,
+            "fats": fats,
+            "carbs": carbs
+        }
+
+    def import_csv(self, csv_path: str, user_id: str = DEFAULT_USER):
+        """Bulk-load a food.csv style file (Date, Meal, Food, Protein, Calories, Fats, Carbs)."""
+        imported = 0
+        with open(csv_path, newline="") as f:
+            reader = csv.DictReader(f)
+            with self._lock, self._conn:
+                for row in reader:
+                    self._insert(
+                        user_id,
+                        row["Date"],
+                        row["Meal"],
+                        row["Food"],
+                        float(row.get("Protein") or 0),
+                        float(row.get("Calories") or 0),
+                        float(row.get("Fats") or 0),
+                        float(row.get("Carbs") or 0)
+                    )
+                    imported += 1
+        return imported
+
+    def has_entries(self, user_id: str = DEFAULT_USER):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT entries FROM user_totals WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        return row is not None and row["entries"] > 0
+
+    def get_entries(self, user_id: str, start_date: str = None, end_date: str = None):
+        """Return a user's entries, optionally limited to an inclusive date range."""
+        query = "SELECT * FROM food_log WHERE user_id = ?"
+        params = [user_id]
+        if start_date:
+            query += " AND date >= ?"
+            params.append(start_date)
+        if end_date:
+            query += " AND date <= ?"
+            params.append(end_date)
+        query += " ORDER BY date, id"
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_stats(self, user_id: str):
+        """Return precomputed totals, averages and dish frequencies for a user."""
+        with self._lock:
+            totals = self._conn.execute(
+                "SELECT * FROM user_totals WHERE user_id = ?", (user_id,)
+            ).fetchone()
+            dishes = self._conn.execute(
+                "SELECT dish, count FROM dish_counts WHERE user_id = ? ORDER BY count DESC, dish",
+                (user_id,)
+            ).fetchall()
+
+        entries = totals["entries"] if totals else 0
+        sums = {col: (totals[col] if totals else 0.0) for col in NUTRIENT_COLUMNS}
+        averages = {col: (sums[col] / entries if entries else None) for col in NUTRIENT_COLUMNS}
+        return {
+            "user_id": user_id,
+            "entries": entries,
+            "totals": sums,
+            "averages": averages,
+            "dish_counts": {row["dish"]: row["count"] for row in dishes}
+        }
+
+
+def open_food_log(data_dir: str, seed_csv: str = None):
+    """Open the food log under data_dir, seeding the default user from seed_csv on first use."""
+    store = FoodLogStore(os.path.join(data_dir, "food_log.db"))
+    if seed_csv and os.path.exists(seed_csv) and not store.has_entries(DEFAULT_USER):
+        imported = store.import_csv(seed_csv, DEFAULT_USER)
+        print(f"Seeded food log with {imported} entries from {seed_csv}")
+    return store
@@ -1,26 +1,42 @@
 import pandas as pd
 import random
 
-def generate_meal_plan(dishes_csv, history_csv, target_calories):
-    # Load the dishes dataset
-    dishes_df = pd.read_csv(dishes_csv)
-    
-    # Load the user's past food history
-    history_df = pd.read_csv(history_csv)
+# Columns the planner selects on and returns for each chosen dish
+PLANNER_COLUMNS = ("Dish", "Calories (kcal)", "Protein (g)", "Fat (g)", "Carbohydrates (g)")
+
+# Fallback protein baseline (grams) for users with no logged history yet
+DEFAULT_PAST_PROTEIN = 50
+
+def generate_meal_plan(dishes_csv=None, history_csv=None, target_calories=2000, history_stats=None, dishes_df=None):
+    # Load the dishes dataset, reusing an already loaded table when one is given
+    if dishes_df is None:
+        dishes_df = pd.read_csv(dishes_csv)
     
-    # Ensure correct column names
-    if 'Food' in history_df.columns:
-        history_df.rename(columns={'Food': 'Dish'}, inplace=True)
+    if history_stats is not None:
+        # Use the food log's precomputed aggregates instead of rescanning history
+        past_protein = history_stats["averages"]["protein"]
+        if past_protein is None:
+            past_protein = DEFAULT_PAST_PROTEIN
+        favorite_dishes = list(history_stats["dish_counts"])
+    else:
+        # Load the user's past food history
+        history_df = pd.read_csv(history_csv)
+        
+        # Ensure correct column names
+        if 'Food' in history_df.columns:
+            history_df.rename(columns={'Food': 'Dish'}, inplace=True)
+        
+        # Calculate past average protein intake
+        past_protein = history_df['Protein'].mean()
+        
+        # Identify user's most frequently eaten dishes
+        favorite_dishes = history_df['Dish'].value_counts().index.tolist()
     
-    # Calculate past average protein intake
-    past_protein = history_df['Protein'].mean()
     target_protein = past_protein * 1.2  # Increase protein intake by 20%
     
-    # Identify user's most frequently eaten dishes
-    favorite_dishes = history_df['Dish'].value_counts().index.tolist()
-    
     # Prioritize favorite dishes in meal selection
-    dishes_df['Preference'] = dishes_df['Dish'].apply(lambda x: 1 if x in favorite_dishes else 0)
+    favorite_set = set(favorite_dishes)
+    dishes_df = dishes_df.assign(Preference=dishes_df['Dish'].isin(favorite_set).astype(int))
     dishes_df = dishes_df.sort_values(by='Preference', ascending=False)
     
     # Shuffle the dataset slightly to add variation
@@ -0,0 +1,206 @@
+"""Columnar nutrition catalog stored as memory-mapped NumPy column files.
+
+Convert a dish CSV once with:
+
+    python nutrition_catalog.py data/nutrition_data.csv data/nutrition_catalog
+
+The output directory holds one ``.npy`` file per column plus a ``manifest.json``.
+Loading maps the files read-only, so startup does no parsing, reading a single
+nutrient column touches only that file, and every worker process shares the
+same page-cache pages.
+"""
+import argparse
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_NAME = "manifest.json"
+KEY_COLUMN = "Dish"
+FORMAT_VERSION = 1
+
+
+def _column_to_array(series: pd.Series):
+    """Turn a pandas column into a fixed-width array that np.load can memory-map."""
+    if pd.api.types.is_numeric_dtype(series):
+        if series.isna().any():
+            return series.to_numpy(dtype=np.float64)
+        return series.to_numpy()
+    # Object columns cannot be memory-mapped, so store fixed-width unicode
+    return series.fillna("").astype(str).to_numpy(dtype=str)
+
+
+def _build_key_index(dishes: np.ndarray):
+    """Return lowercased dish keys in sorted order and the row each one points to."""
+    keys = np.char.lower(dishes)
+    order = np.argsort(keys, kind="stable")
+    return keys[order], order.astype(np.int64)
+
+
+def convert_csv(csv_path: str, out_dir: str):
+    """Write csv_path as a columnar catalog in out_dir, replacing any previous one."""
+    df = pd.read_csv(csv_path)
+    stat = os.stat(csv_path)
+
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".nutrition_catalog_", dir=parent)
+    try:
+        columns = []
+        for i, name in enumerate(df.columns):
+            array = _column_to_array(df[name])
+            filename = f"col_{i:04d}.npy"
+            np.save(os.path.join(tmp_dir, filename), array, allow_pickle=False)
+            columns.append({"name": name, "file": filename, "dtype": array.dtype.str})
+
+        key_index = None
+        if KEY_COLUMN in df.columns:
+            keys, order = _build_key_index(_column_to_array(df[KEY_COLUMN]))
+            np.save(os.path.join(tmp_dir, "key_sorted.npy"), keys, allow_pickle=False)
+            np.save(os.path.join(tmp_dir, "key_order.npy"), order, allow_pickle=False)
+            key_index = {"column": KEY_COLUMN, "sorted": "key_sorted.npy", "order": "key_order.npy"}
+
+        manifest = {
+            "version": FORMAT_VERSION,
+            "rows": len(df),
+            "columns": columns,
+            "key_index": key_index,
+            "source": {
+                "path": os.path.abspath(csv_path),
+                "size": stat.st_size,
+                "mtime": stat.st_mtime
+            }
+        }
+        with open(os.path.join(tmp_dir, MANIFEST_NAME), "w") as f:
+            json.dump(manifest, f, indent=2)
+
+        if os.path.exists(out_dir):
+            shutil.rmtree(out_dir)
+        os.rename(tmp_dir, out_dir)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    return manifest
+
+
+class NutritionCatalog:
+    """Read-only, column-oriented view of the dish nutrition table."""
+
+    def __init__(self, columns: dict = None, key_sorted=None, key_order=None, manifest=None):
+        self._columns = columns or {}
+        self.manifest = manifest or {}
+        if key_sorted is None and KEY_COLUMN in self._columns:
+            key_sorted, key_order = _build_key_index(self._columns[KEY_COLUMN])
+        self._key_sorted = key_sorted
+        self._key_order = key_order
+        self._key_list = None
+        self._frames = {}
+
+    @classmethod
+    def open(cls, catalog_dir: str):
+        """Memory-map a catalog written by convert_csv."""
+        with open(os.path.join(catalog_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported catalog version: {manifest.get('version')}")
+
+        columns = {
+            col["name"]: np.load(os.path.join(catalog_dir, col["file"]), mmap_mode="r")
+            for col in manifest["columns"]
+        }
+        key_sorted = key_order = None
+        if manifest.get("key_index"):
+            key_sorted = np.load(os.path.join(catalog_dir, manifest["key_index"]["sorted"]), mmap_mode="r")
+            key_order = np.load(os.path.join(catalog_dir, manifest["key_index"]["order"]), mmap_mode="r")
+        return cls(columns, key_sorted, key_order, manifest)
+
+    @classmethod
+    def from_csv(cls, csv_path: str):
+        """Build an in-memory catalog straight from a CSV (no conversion step)."""
+        df = pd.read_csv(csv_path)
+        columns = {name: _column_to_array(df[name]) for name in df.columns}
+        return cls(columns)
+
+    def is_stale(self, csv_path: str):
+        """True if csv_path changed since this catalog was converted from it."""
+        source = self.manifest.get("source")
+        if not source or not os.path.exists(csv_path):
+            return False
+        stat = os.stat(csv_path)
+        return stat.st_size != source["size"] or stat.st_mtime > source["mtime"]
+
+    def __len__(self):
+        if not self._columns:
+            return 0
+        return len(next(iter(self._columns.values())))
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    def column(self, name: str):
+        """Return one column as a (possibly memory-mapped) NumPy array."""
+        return self._columns[name]
+
+    def keys(self):
+        """All lowercased dish names, e.g. for fuzzy matching."""
+        if self._key_sorted is None:
+            return []
+        if self._key_list is None:
+            self._key_list = self._key_sorted.tolist()
+        return self._key_list
+
+    def find(self, name: str):
+        """Return the row index of a dish by case-insensitive exact name, or None."""
+        if self._key_sorted is None or len(self._key_sorted) == 0:
+            return None
+        key = name.lower()
+        pos = int(np.searchsorted(self._key_sorted, key))
+        if pos < len(self._key_sorted) and self._key_sorted[pos] == key:
+            return int(self._key_order[pos])
+        return None
+
+    def row(self, index: int):
+        """Return a single row as a dict of Python scalars."""
+        return {name: values[index].item() for name, values in self._columns.items()}
+
+    def to_frame(self, columns=None):
+        """Materialize the given columns (default: all) as a DataFrame, cached per column set.
+
+        This copies the selected columns out of the memory map, so callers
+        should ask only for the columns they need.
+        """
+        columns = tuple(columns or self._columns)
+        if columns not in self._frames:
+            self._frames[columns] = pd.DataFrame({name: np.asarray(self._columns[name]) for name in columns})
+        return self._frames[columns]
+
+
+def load_nutrition_catalog(catalog_dir: str, csv_path: str):
+    """Open the converted catalog if it is present and current, else fall back to the CSV."""
+    if os.path.exists(os.path.join(catalog_dir, MANIFEST_NAME)):
+        catalog = NutritionCatalog.open(catalog_dir)
+        if not catalog.is_stale(csv_path):
+            return catalog
+        print(f"WARNING: Nutrition catalog at {catalog_dir} is older than {csv_path}; "
+              f"rerun nutrition_catalog.py to refresh it")
+    if os.path.exists(csv_path):
+        return NutritionCatalog.from_csv(csv_path)
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a nutrition CSV into a memory-mappable columnar catalog.")
+    parser.add_argument("csv_path", help="Source CSV, e.g. data/nutrition_data.csv")
+    parser.add_argument("out_dir", help="Output catalog directory, e.g. data/nutrition_catalog")
+    args = parser.parse_args()
+
+    manifest = convert_csv(args.csv_path, args.out_dir)
+    print(f"Wrote {manifest['rows']} rows x {len(manifest['columns'])} columns to {args.out_dir}")
+
+
+if __name__ == "__main__":
+    main()
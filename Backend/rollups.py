@@ -0,0 +1,286 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+
+# Metrics kept per user per day
+METRICS = ("steps", "calories_burned", "sleep_hours", "protein", "calories_in", "fats", "carbs", "meals")
+
+# Daily goals used for adherence and streaks
+GOALS = {
+    "steps": 10000,        # at least this many steps
+    "sleep_hours": 7,      # at least this much sleep
+    "calories_in": 2000,   # within CALORIE_TOLERANCE of this intake
+    "protein": 50          # at least this many grams of protein
+}
+CALORIE_TOLERANCE = 0.10
+
+PERIODS = ("week", "month")
+
+# Default and maximum number of buckets returned per period
+DEFAULT_COUNTS = {"daily": 7, "weekly": 4, "monthly": 6}
+MAX_COUNTS = {"daily": 366, "weekly": 104, "monthly": 60}
+
+# How far back streaks are searched
+STREAK_LOOKBACK_DAYS = 366
+
+# Most cached read responses kept; the least recently used is dropped first
+ROLLUP_CACHE_SIZE = 256
+
+
+def goals_met(values: dict):
+    """Which daily goals a day's metric values meet."""
+    calories = values.get("calories_in", 0)
+    return {
+        "steps": values.get("steps", 0) >= GOALS["steps"],
+        "sleep_hours": values.get("sleep_hours", 0) >= GOALS["sleep_hours"],
+        "calories_in": calories > 0 and abs(calories - GOALS["calories_in"]) <= GOALS["calories_in"] * CALORIE_TOLERANCE,
+        "protein": values.get("protein", 0) >= GOALS["protein"]
+    }
+
+
+def period_start(day: str, period: str):
+    """First day (YYYY-MM-DD) of the ISO week or calendar month containing day."""
+    d = datetime.strptime(day, "%Y-%m-%d").date()
+    if period == "week":
+        return (d - timedelta(days=d.weekday())).isoformat()
+    return d.replace(day=1).isoformat()
+
+
+def _shift_period(start: date, period: str, steps: int):
+    """Move a week/month start back by the given number of periods."""
+    if period == "week":
+        return start - timedelta(weeks=steps)
+    month = start.month - 1 - steps
+    return start.replace(year=start.year + month // 12, month=month % 12 + 1, day=1)
+
+
+class RollupStore:
+    """Per-user daily, weekly and monthly aggregates, updated by delta on every write.
+
+    Each change to a day's metrics is applied to the daily row and to the
+    enclosing week and month rows, including how many days met each goal, so
+    reads never scan raw history. The tables live in the food log database and
+    food entries are folded in from inside FoodLogStore's insert transaction,
+    so the log and its rollups cannot drift apart. Read responses are cached in
+    a bounded LRU (one per user and granularity, users with data only) and
+    invalidated when that user's data changes.
+    """
+
+    def __init__(self, conn, lock):
+        self._conn = conn
+        self._lock = lock
+        self._cache = OrderedDict()
+        self._versions = {}
+        self._create_tables()
+
+    def _create_tables(self):
+        metric_cols = ",\n".join(f"{m} REAL NOT NULL DEFAULT 0" for m in METRICS)
+        goal_cols = ",\n".join(f"{g}_goal_days INTEGER NOT NULL DEFAULT 0" for g in GOALS)
+        with self._lock, self._conn:
+            self._conn.executescript(f"""
+                CREATE TABLE IF NOT EXISTS daily_rollups (
+                    user_id TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    {metric_cols},
+                    PRIMARY KEY (user_id, date)
+                );
+
+                CREATE TABLE IF NOT EXISTS period_rollups (
+                    user_id TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    period_start TEXT NOT NULL,
+                    days INTEGER NOT NULL DEFAULT 0,
+                    {metric_cols},
+                    {goal_cols},
+                    PRIMARY KEY (user_id, period, period_start)
+                );
+            """)
+
+    def _apply(self, user_id: str, day: str, values: dict, replace: bool):
+        """Add (or, with replace, overwrite) metric values for one day in its own transaction."""
+        with self._lock, self._conn:
+            self._apply_in_transaction(user_id, day, values, replace)
+
+    def _apply_in_transaction(self, user_id: str, day: str, values: dict, replace: bool):
+        """Update one day and roll the delta upwards (caller holds the lock and the transaction)."""
+        row = self._conn.execute(
+            "SELECT * FROM daily_rollups WHERE user_id = ? AND date = ?", (user_id, day)
+        ).fetchone()
+        old = {m: (row[m] if row else 0.0) for m in METRICS}
+        new = dict(old)
+        for metric, value in values.items():
+            new[metric] = value if replace else old[metric] + value
+
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO daily_rollups (user_id, date, {', '.join(METRICS)}) "
+            f"VALUES (?, ?, {', '.join('?' for _ in METRICS)})",
+            (user_id, day, *(new[m] for m in METRICS))
+        )
+
+        delta = {m: new[m] - old[m] for m in METRICS}
+        old_met, new_met = goals_met(old), goals_met(new)
+        goal_delta = {g: int(new_met[g]) - int(old_met[g]) for g in GOALS}
+        new_day = 0 if row else 1
+
+        columns = ["days", *METRICS, *(f"{g}_goal_days" for g in GOALS)]
+        params = [new_day, *(delta[m] for m in METRICS), *(goal_delta[g] for g in GOALS)]
+        updates = ", ".join(f"{col} = {col} + excluded.{col}" for col in columns)
+        for period in PERIODS:
+            self._conn.execute(
+                f"INSERT INTO period_rollups (user_id, period, period_start, {', '.join(columns)}) "
+                f"VALUES (?, ?, ?, {', '.join('?' for _ in columns)}) "
+                f"ON CONFLICT (user_id, period, period_start) DO UPDATE SET {updates}",
+                (user_id, period, period_start(day, period), *params)
+            )
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def record_food(self, user_id: str, day: str, protein=0, calories=0, fats=0, carbs=0):
+        """Fold one food log entry into the user's rollups.
+
+        Called by FoodLogStore inside its insert transaction, with its lock held.
+        """
+        self._apply_in_transaction(user_id, day, {
+            "protein": protein,
+            "calories_in": calories,
+            "fats": fats,
+            "carbs": carbs,
+            "meals": 1
+        }, replace=False)
+
+    def set_activity(self, user_id: str, day: str, **values):
+        """Record a day's fitness totals (steps, calories_burned, sleep_hours), replacing earlier values."""
+        unknown = set(values) - set(METRICS)
+        if unknown:
+            raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+        self._apply(user_id, day, values, replace=True)
+
+    def backfill_food_log(self):
+        """Build food rollups for every user in food_log that has none yet (first run after upgrade)."""
+        with self._lock, self._conn:
+            users = [row["user_id"] for row in self._conn.execute(
+                "SELECT DISTINCT user_id FROM food_log "
+                "WHERE user_id NOT IN (SELECT DISTINCT user_id FROM daily_rollups WHERE meals > 0)"
+            ).fetchall()]
+            entries = 0
+            for user_id in users:
+                for entry in self._conn.execute(
+                    "SELECT date, protein, calories, fats, carbs FROM food_log WHERE user_id = ? ORDER BY date, id",
+                    (user_id,)
+                ).fetchall():
+                    self.record_food(user_id, entry["date"], entry["protein"], entry["calories"],
+                                     entry["fats"], entry["carbs"])
+                    entries += 1
+        return len(users), entries
+
+    def _bucket(self, start: str, row, is_period: bool):
+        totals = {m: row[m] for m in METRICS}
+        if is_period:
+            days = row["days"]
+            goal_days = {g: row[f"{g}_goal_days"] for g in GOALS}
+        else:
+            days = 1
+            goal_days = {g: int(met) for g, met in goals_met(totals).items()}
+        return {
+            "start": start,
+            "days": days,
+            "totals": totals,
+            "means": {m: (totals[m] / days if days else 0.0) for m in METRICS},
+            "goal_days": goal_days,
+            "adherence": {g: (goal_days[g] / days if days else 0.0) for g in GOALS}
+        }
+
+    def _streaks(self, user_id: str, end_day: date):
+        rows = self._conn.execute(
+            "SELECT * FROM daily_rollups WHERE user_id = ? AND date <= ? AND date > ? ORDER BY date DESC",
+            (user_id, end_day.isoformat(), (end_day - timedelta(days=STREAK_LOOKBACK_DAYS)).isoformat())
+        ).fetchall()
+        met_by_day = {row["date"]: goals_met({m: row[m] for m in METRICS}) for row in rows}
+
+        streaks = {}
+        for goal in GOALS:
+            # Today may still be in progress, so an unmet today doesn't break the current streak
+            current = 0
+            day = end_day
+            if day == date.today() and not met_by_day.get(day.isoformat(), {}).get(goal):
+                day -= timedelta(days=1)
+            while met_by_day.get(day.isoformat(), {}).get(goal):
+                current += 1
+                day -= timedelta(days=1)
+
+            best = run = 0
+            previous = None
+            for row in reversed(rows):
+                d = datetime.strptime(row["date"], "%Y-%m-%d").date()
+                if met_by_day[row["date"]][goal]:
+                    run = run + 1 if previous is not None and d - previous == timedelta(days=1) else 1
+                    previous = d
+                    best = max(best, run)
+                else:
+                    run = 0
+                    previous = None
+            streaks[goal] = {"current": current, "best": best}
+        return streaks
+
+    def get_rollup(self, user_id: str, granularity: str = "daily", count: int = None, end_date: str = None):
+        """Return the last count daily/weekly/monthly buckets up to end_date, plus goal streaks."""
+        if granularity not in DEFAULT_COUNTS:
+            raise ValueError(f"granularity must be one of {', '.join(DEFAULT_COUNTS)}")
+        count = DEFAULT_COUNTS[granularity] if count is None else count
+        if not 1 <= count <= MAX_COUNTS[granularity]:
+            raise ValueError(f"count for {granularity} rollups must be between 1 and {MAX_COUNTS[granularity]}")
+        end_day = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else date.today()
+
+        # One cache slot per user and granularity; a different count/end_date replaces it
+        slot = (user_id, granularity)
+        request = (count, end_day.isoformat())
+        with self._lock:
+            version = self._versions.get(user_id, 0)
+            cached = self._cache.get(slot)
+            if cached and cached[0] == version and cached[1] == request:
+                self._cache.move_to_end(slot)
+                return cached[2]
+
+            if granularity == "daily":
+                first = end_day - timedelta(days=count - 1)
+                rows = self._conn.execute(
+                    "SELECT * FROM daily_rollups WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date",
+                    (user_id, first.isoformat(), end_day.isoformat())
+                ).fetchall()
+                buckets = [self._bucket(row["date"], row, is_period=False) for row in rows]
+            else:
+                period = "week" if granularity == "weekly" else "month"
+                last = datetime.strptime(period_start(end_day.isoformat(), period), "%Y-%m-%d").date()
+                first = _shift_period(last, period, count - 1)
+                rows = self._conn.execute(
+                    "SELECT * FROM period_rollups WHERE user_id = ? AND period = ? "
+                    "AND period_start BETWEEN ? AND ? ORDER BY period_start",
+                    (user_id, period, first.isoformat(), last.isoformat())
+                ).fetchall()
+                buckets = [self._bucket(row["period_start"], row, is_period=True) for row in rows]
+            streaks = self._streaks(user_id, end_day)
+
+        result = {
+            "user_id": user_id,
+            "granularity": granularity,
+            "end_date": end_day.isoformat(),
+            "goals": GOALS,
+            "buckets": buckets,
+            "streaks": streaks
+        }
+        # Don't spend cache slots on unknown users or empty ranges
+        if buckets or any(streak["best"] for streak in streaks.values()):
+            with self._lock:
+                self._cache[slot] = (version, request, result)
+                self._cache.move_to_end(slot)
+                while len(self._cache) > ROLLUP_CACHE_SIZE:
+                    self._cache.popitem(last=False)
+        return result
+
+
+def open_rollups(food_log_store):
+    """Attach a rollup store to the food log's database and backfill users that have no rollups."""
+    store = RollupStore(food_log_store.connection, food_log_store.lock)
+    food_log_store.rollups = store
+    users, entries = store.backfill_food_log()
+    if entries:
+        print(f"Backfilled rollups for {users} users from {entries} food log entries")
+    return store